@@ -170,13 +170,13 @@ async def advanced_usage_example():
     print("\n3. 缓存机制:")
     import time
     
-    start_time = time.time()
+    start_time = time.perf_counter()
     data1 = await scheduler.get_screen_elements()
-    time1 = time.time() - start_time
+    time1 = time.perf_counter() - start_time
     
-    start_time = time.time()
+    start_time = time.perf_counter()
     data2 = await scheduler.get_screen_elements()  # 应该使用缓存
-    time2 = time.time() - start_time
+    time2 = time.perf_counter() - start_time
     
     print(f"第一次提取耗时: {time1:.2f}秒")
     print(f"第二次提取耗时: {time2:.2f}秒 (使用缓存)")
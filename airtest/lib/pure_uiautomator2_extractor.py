@@ -12,6 +12,7 @@ Enhanced Pure UIAutomator2 Widget Extractor with Omniparser Integration
 
 import sys
 import os
+import re
 import json
 import xml.etree.ElementTree as ET
 import asyncio
@@ -23,6 +24,7 @@ from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Union, Any
 from enum import Enum
 from dataclasses import dataclass
+from functools import cached_property
 
 # 添加项目路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
@@ -31,6 +33,24 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("enhanced_ui_extractor")
 
+# `adb shell wm size` 输出解析，例如 "Physical size: 1080x1920"
+_WM_SIZE_RE = re.compile(r'(\d+)x(\d+)')
+# UI层次XML中的bounds，例如 "[0,0][1080,1920]"
+_BOUNDS_RE = re.compile(r'-?\d+')
+
+
+def _write_json(filename: str, data: Any):
+    """将数据一次性编码后写入JSON文件，避免 json.dump 逐片段调用 write
+
+    先写入同目录临时文件再原子替换，中途失败不会留下被截断的文件。
+    """
+    content = json.dumps(data, indent=2, ensure_ascii=False)
+    tmp_file = f"{filename}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_file, filename)
+
+
 class ExtractionMode(Enum):
     """提取模式枚举"""
     AUTO = "auto"           # 自动选择模式
@@ -46,7 +66,7 @@ class PlaybackState(Enum):
     STOPPED = "stopped"
 
 
-@dataclass
+@dataclass(slots=True)
 class UnifiedElement:
     """统一元素结构"""
     uuid: str
@@ -105,11 +125,8 @@ class PlaybackDetector:
     async def detect_playback_state(self) -> PlaybackState:
         """检测当前播放状态"""
         try:
-            # 方法1: 检查音频flinger状态
-            audio_active = await self._check_audio_flinger()
-            
-            # 方法2: 检查Wake Locks
-            wake_lock_active = await self._check_wake_locks()
+            # 方法1: 检查音频flinger状态; 方法2: 检查Wake Locks
+            audio_active, wake_lock_active = await self._probe_playback_signals()
             
             # 综合判断
             if audio_active or wake_lock_active:
@@ -123,45 +140,29 @@ class PlaybackDetector:
             logger.error(f"播放状态检测失败: {e}")
             return PlaybackState.UNKNOWN
     
-    async def _check_audio_flinger(self) -> bool:
-        """检查音频flinger状态"""
-        try:
-            cmd = 'adb shell "dumpsys media.audio_flinger | grep \\"Standby: no\\" | wc -l"'
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await proc.communicate()
-            
-            if proc.returncode == 0:
-                count = int(stdout.decode().strip())
-                return count >= 1
-                
-        except Exception as e:
-            logger.warning(f"音频flinger检测失败: {e}")
-        
-        return False
-    
-    async def _check_wake_locks(self) -> bool:
-        """检查Wake Locks状态"""
+    async def _probe_playback_signals(self) -> Tuple[bool, bool]:
+        """在一次adb shell调用中同时检查音频flinger与Wake Locks状态"""
         try:
-            cmd = 'adb shell "dumpsys power | grep -i wake | grep Audio | wc -l"'
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
+            # 管道在设备端shell中执行，本地直接exec adb，无需再经过 sh -c
+            remote_cmd = ('dumpsys media.audio_flinger | grep -c "Standby: no"; '
+                          'dumpsys power | grep -i wake | grep -c Audio')
+            proc = await asyncio.create_subprocess_exec(
+                "adb", "shell", remote_cmd,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
             stdout, stderr = await proc.communicate()
             
-            if proc.returncode == 0:
-                count = int(stdout.decode().strip())
-                return count >= 1
+            # grep -c 无匹配时退出码为1但仍输出0，因此按输出而非退出码判断
+            counts = stdout.decode().split()
+            if len(counts) == 2 and all(c.isdigit() for c in counts):
+                audio_count, wake_lock_count = int(counts[0]), int(counts[1])
+                return audio_count >= 1, wake_lock_count >= 1
                 
         except Exception as e:
-            logger.warning(f"Wake Lock检测失败: {e}")
+            logger.warning(f"播放状态探测失败: {e}")
         
-        return False
+        return False, False
 
 
 class OmniparserClient:
@@ -180,7 +181,8 @@ class OmniparserClient:
         """健康检查"""
         try:
             probe_url = f"{self.server_url}/probe/"
-            response = self.session.get(probe_url, timeout=10)
+            # requests是阻塞调用，放到线程中执行以免阻塞事件循环
+            response = await asyncio.to_thread(self.session.get, probe_url, timeout=10)
             response.raise_for_status()
             return True
         except Exception as e:
@@ -221,6 +223,8 @@ class VisualExtractor:
         self.screen_height = 1920
         self._cache = {}
         self._cache_timeout = 5.0
+        # `wm size` 物理分辨率在会话内不变，只需查询一次
+        self._physical_size = None
     
     async def get_screen_size(self) -> Tuple[int, int]:
         """获取屏幕尺寸"""
@@ -229,21 +233,23 @@ class VisualExtractor:
                 info = self.device.info
                 self.screen_width = info.get('displayWidth', 1080)
                 self.screen_height = info.get('displayHeight', 1920)
+            elif self._physical_size:
+                self.screen_width, self.screen_height = self._physical_size
             else:
                 # 使用ADB获取
-                proc = await asyncio.create_subprocess_shell(
-                    "adb shell wm size",
+                proc = await asyncio.create_subprocess_exec(
+                    "adb", "shell", "wm", "size",
                     stdout=asyncio.subprocess.PIPE,
                     stderr=asyncio.subprocess.PIPE
                 )
                 stdout, stderr = await proc.communicate()
                 
                 if proc.returncode == 0:
-                    import re
-                    match = re.search(r'(\d+)x(\d+)', stdout.decode())
+                    match = _WM_SIZE_RE.search(stdout.decode())
                     if match:
                         self.screen_width = int(match.group(1))
                         self.screen_height = int(match.group(2))
+                        self._physical_size = (self.screen_width, self.screen_height)
             
             return self.screen_width, self.screen_height
             
@@ -254,29 +260,18 @@ class VisualExtractor:
     async def take_screenshot(self) -> str:
         """截屏并返回base64"""
         try:
-            # 使用ADB截屏
-            temp_file = f"/tmp/screenshot_{int(time.time())}.png"
-            
-            proc = await asyncio.create_subprocess_shell(
-                f"adb shell screencap -p > {temp_file}",
+            # 使用ADB截屏，exec-out 直接输出二进制PNG，无需落盘再读回
+            proc = await asyncio.create_subprocess_exec(
+                "adb", "exec-out", "screencap", "-p",
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
-            stdout, stderr = await proc.communicate()
+            image_data, stderr = await proc.communicate()
             
-            if proc.returncode != 0:
+            if proc.returncode != 0 or not image_data:
                 raise Exception(f"截屏失败: {stderr.decode()}")
             
-            # 读取并转换为base64
-            with open(temp_file, 'rb') as f:
-                image_data = f.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-            
-            # 清理临时文件
-            try:
-                os.remove(temp_file)
-            except:
-                pass
+            base64_image = base64.b64encode(image_data).decode('utf-8')
             
             return base64_image
             
@@ -289,7 +284,7 @@ class VisualExtractor:
         try:
             # 检查缓存
             cache_key = "visual_elements"
-            current_time = time.time()
+            current_time = time.monotonic()
             
             if use_cache and cache_key in self._cache:
                 cached_data, timestamp = self._cache[cache_key]
@@ -362,9 +357,8 @@ class EnhancedUIAutomator2Extractor:
         self.xml_content = None
         self.screen_size = (1440, 2560)
         
-        # 初始化组件
-        self.omniparser_client = OmniparserClient(omniparser_url)
-        self.visual_extractor = VisualExtractor(self.omniparser_client)
+        # 初始化组件 (Omniparser客户端与视觉提取器在首次使用时创建)
+        self.omniparser_url = omniparser_url
         self.playback_detector = PlaybackDetector()
         
         # 缓存
@@ -372,6 +366,19 @@ class EnhancedUIAutomator2Extractor:
         self._visual_elements_cache = None
         self._last_extraction_mode = None
         
+    @cached_property
+    def omniparser_client(self) -> OmniparserClient:
+        """Omniparser客户端，仅在需要视觉识别或健康检查时创建"""
+        return OmniparserClient(self.omniparser_url)
+    
+    @cached_property
+    def visual_extractor(self) -> VisualExtractor:
+        """视觉提取器，仅在使用视觉模式时创建"""
+        visual_extractor = VisualExtractor(self.omniparser_client, self.device)
+        if self.device:
+            visual_extractor.screen_width, visual_extractor.screen_height = self.screen_size
+        return visual_extractor
+    
     def connect_device(self):
         """连接设备"""
         try:
@@ -389,10 +396,11 @@ class EnhancedUIAutomator2Extractor:
             self.screen_size = (info.get('displayWidth', 1440), info.get('displayHeight', 2560))
             logger.info(f"屏幕尺寸: {self.screen_size[0]}x{self.screen_size[1]}")
             
-            # 更新相关组件的设备引用
-            self.visual_extractor.device = self.device
-            self.visual_extractor.screen_width = self.screen_size[0]
-            self.visual_extractor.screen_height = self.screen_size[1]
+            # 更新相关组件的设备引用 (视觉提取器未创建时会在创建时读取)
+            if 'visual_extractor' in self.__dict__:
+                self.visual_extractor.device = self.device
+                self.visual_extractor.screen_width = self.screen_size[0]
+                self.visual_extractor.screen_height = self.screen_size[1]
             self.playback_detector.device = self.device
             
             return True
@@ -404,11 +412,11 @@ class EnhancedUIAutomator2Extractor:
     async def detect_optimal_mode(self) -> ExtractionMode:
         """检测最佳提取模式"""
         try:
-            # 检查Omniparser服务器状态
-            omniparser_available = await self.omniparser_client.health_check()
-            
-            # 检查播放状态
-            playback_state = await self.playback_detector.detect_playback_state()
+            # 并发检查Omniparser服务器状态与播放状态
+            omniparser_available, playback_state = await asyncio.gather(
+                self.omniparser_client.health_check(),
+                self.playback_detector.detect_playback_state()
+            )
             
             if playback_state == PlaybackState.PLAYING:
                 if omniparser_available:
@@ -427,13 +435,9 @@ class EnhancedUIAutomator2Extractor:
     
     def parse_bounds(self, bounds_str):
         """解析bounds字符串"""
-        try:
-            bounds_str = bounds_str.replace('[', '').replace(']', ',')
-            coords = [int(x) for x in bounds_str.split(',') if x]
-            if len(coords) >= 4:
-                return coords[0], coords[1], coords[2], coords[3]
-        except (ValueError, IndexError):
-            pass
+        coords = _BOUNDS_RE.findall(bounds_str)
+        if len(coords) >= 4:
+            return int(coords[0]), int(coords[1]), int(coords[2]), int(coords[3])
         return 0, 0, 0, 0
     
     def get_xml_from_device(self):
@@ -491,12 +495,13 @@ class EnhancedUIAutomator2Extractor:
         x1, y1, x2, y2 = self.parse_bounds(bounds_str)
         
         # 计算归一化坐标
-        if self.screen_size[0] > 0 and self.screen_size[1] > 0:
+        screen_width, screen_height = self.screen_size
+        if screen_width > 0 and screen_height > 0:
             norm_bounds = [
-                x1 / self.screen_size[0],
-                y1 / self.screen_size[1],
-                x2 / self.screen_size[0],
-                y2 / self.screen_size[1]
+                x1 / screen_width,
+                y1 / screen_height,
+                x2 / screen_width,
+                y2 / screen_height
             ]
             center_x = (norm_bounds[0] + norm_bounds[2]) / 2
             center_y = (norm_bounds[1] + norm_bounds[3]) / 2
@@ -603,16 +608,19 @@ class EnhancedUIAutomator2Extractor:
         """根据文本查找元素"""
         elements, actual_mode = await self.extract_elements_unified(mode)
         
+        # 查询文本只需规范化一次
+        search_text = text.lower()
+        
         matches = []
         for element in elements:
             element_text = element.text.lower()
-            search_text = text.lower()
+            element_name = element.name.lower()
             
             if partial_match:
-                if search_text in element_text or search_text in element.name.lower():
+                if search_text in element_text or search_text in element_name:
                     matches.append(element)
             else:
-                if element_text == search_text or element.name.lower() == search_text:
+                if element_text == search_text or element_name == search_text:
                     matches.append(element)
         
         logger.info(f"找到 {len(matches)} 个匹配 '{text}' 的元素")
@@ -658,8 +666,8 @@ class EnhancedUIAutomator2Extractor:
                 return True
             else:
                 # 降级使用ADB
-                proc = await asyncio.create_subprocess_shell(
-                    f"adb shell input tap {x} {y}",
+                proc = await asyncio.create_subprocess_exec(
+                    "adb", "shell", "input", "tap", str(x), str(y),
                     stdout=asyncio.subprocess.PIPE,
                     stderr=asyncio.subprocess.PIPE
                 )
@@ -707,18 +715,32 @@ class EnhancedUIAutomator2Extractor:
         if filter_package:
             elements = [e for e in elements if filter_package in e.package]
         
+        # 单次遍历完成统计
+        xml_count = visual_count = clickable_count = text_count = 0
+        element_dicts = []
+        for element in elements:
+            if element.element_type == "xml":
+                xml_count += 1
+            elif element.element_type == "visual":
+                visual_count += 1
+            if element.clickable:
+                clickable_count += 1
+            if element.text.strip():
+                text_count += 1
+            element_dicts.append(element.to_dict())
+        
         return {
             "total_count": len(elements),
             "extraction_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "extraction_mode": actual_mode.value,
             "screen_size": self.screen_size,
             "playback_state": (await self.playback_detector.detect_playback_state()).value,
-            "elements": [element.to_dict() for element in elements],
+            "elements": element_dicts,
             "statistics": {
-                "xml_elements": len([e for e in elements if e.element_type == "xml"]),
-                "visual_elements": len([e for e in elements if e.element_type == "visual"]),
-                "clickable_elements": len([e for e in elements if e.clickable]),
-                "text_elements": len([e for e in elements if e.text.strip()])
+                "xml_elements": xml_count,
+                "visual_elements": visual_count,
+                "clickable_elements": clickable_count,
+                "text_elements": text_count
             }
         }
     
@@ -726,8 +748,7 @@ class EnhancedUIAutomator2Extractor:
         """保存元素到JSON文件（同步版本）"""
         async def _save():
             data = await self.get_elements_json(mode, filter_package)
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            _write_json(filename, data)
             logger.info(f"元素数据已保存到: {filename}")
         
         # 运行异步函数
@@ -842,8 +863,10 @@ class UIAutomationScheduler:
     
     async def get_current_mode_info(self) -> Dict[str, Any]:
         """获取当前模式信息"""
-        playback_state = await self.extractor.playback_detector.detect_playback_state()
-        omniparser_available = await self.extractor.omniparser_client.health_check()
+        playback_state, omniparser_available = await asyncio.gather(
+            self.extractor.playback_detector.detect_playback_state(),
+            self.extractor.omniparser_client.health_check()
+        )
         
         return {
             "current_mode": self.default_mode.value,
@@ -863,8 +886,7 @@ def extract_from_device(device_id=None, output_file="enhanced_ui_widgets.json"):
         
         data = await scheduler.get_screen_elements()
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        _write_json(output_file, data)
         
         logger.info(f"数据已保存到: {output_file}")
         return data
@@ -912,8 +934,7 @@ async def main():
         
         # 保存结果
         filename = f"enhanced_ui_elements_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(elements_data, f, indent=2, ensure_ascii=False)
+        _write_json(filename, elements_data)
         
         print(f"✅ 数据已保存到: {filename}")
         
@@ -17,6 +17,9 @@ OUTPUT_DIR = "./tmp/outputs"
 TYPING_DELAY_MS = 12
 TYPING_GROUP_SIZE = 50
 
+# `adb shell input text` escapes: spaces become %s, single quotes are backslash-escaped
+INPUT_TEXT_ESCAPES = str.maketrans({" ": "%s", "'": "\\'"})
+
 # Android-specific actions (removed hover as Android doesn't support it)
 Action = Literal[
     "key",
@@ -36,6 +39,14 @@ Action = Literal[
 ]
 
 
+# Navigation actions and the key events they send
+NAVIGATION_KEYCODES: dict[str, str] = {
+    "back": "KEYCODE_BACK",
+    "home": "KEYCODE_HOME",
+    "recent_apps": "KEYCODE_APP_SWITCH",
+}
+
+
 class Resolution(TypedDict):
     width: int
     height: int
@@ -104,6 +115,8 @@ class AndroidComputerTool(BaseAnthropicTool):
         self.is_scaling = is_scaling
         self.width, self.height = self.get_screen_size()
         print(f"Android screen size: {self.width}, {self.height}")
+        # Screen size is fixed for the tool's lifetime, so resolve the scaling target once
+        self._scaling_target = self._resolve_scaling_target()
 
         # Android-specific key mappings
         self.key_conversion = {
@@ -204,24 +217,19 @@ class AndroidComputerTool(BaseAnthropicTool):
             
             elif action == "type":
                 # Android text input - escape special characters
-                escaped_text = text.replace(' ', '%s').replace("'", "\\'")
+                escaped_text = text.translate(INPUT_TEXT_ESCAPES)
                 self.send_adb_command(f"shell input text '{escaped_text}'")
                 screenshot_base64 = (await self.screenshot()).base64_image
                 return ToolResult(output=text, base64_image=screenshot_base64)
 
         # Handle Android navigation buttons
-        if action in ("back", "home", "recent_apps"):
+        if action in NAVIGATION_KEYCODES:
             if text is not None:
                 raise ToolError(f"text is not accepted for {action}")
             if coordinate is not None:
                 raise ToolError(f"coordinate is not accepted for {action}")
 
-            if action == "back":
-                self.send_adb_command("shell input keyevent KEYCODE_BACK")
-            elif action == "home":
-                self.send_adb_command("shell input keyevent KEYCODE_HOME")
-            elif action == "recent_apps":
-                self.send_adb_command("shell input keyevent KEYCODE_APP_SWITCH")
+            self.send_adb_command(f"shell input keyevent {NAVIGATION_KEYCODES[action]}")
             
             return ToolResult(output=f"Performed {action}")
 
@@ -276,8 +284,8 @@ class AndroidComputerTool(BaseAnthropicTool):
         """
         Executes an ADB command on the Android device via HTTP server.
         """
-        device_prefix = f"-s {self.device_id} " if self.device_id else ""
-        full_command = ["adb", device_prefix + command] if device_prefix else ["adb"] + command.split()
+        device_args = ["-s", self.device_id] if self.device_id else []
+        full_command = ["adb", *device_args, *command.split()]
         
         try:
             print(f"Sending ADB command: {full_command}")
@@ -332,22 +340,8 @@ class AndroidComputerTool(BaseAnthropicTool):
         if not self._scaling_enabled:
             return x, y
         
-        ratio = self.width / self.height
-        target_dimension = None
-
-        # Find best matching Android resolution
-        for target_name, dimension in MAX_SCALING_TARGETS.items():
-            target_ratio = dimension["width"] / dimension["height"]
-            if abs(target_ratio - ratio) < 0.05:  # Allow for aspect ratio variations
-                if dimension["width"] <= self.width:
-                    target_dimension = dimension
-                    self.target_dimension = target_dimension
-                break
-
-        if target_dimension is None:
-            # Default to FHD if no match found
-            target_dimension = MAX_SCALING_TARGETS["FHD"]
-            self.target_dimension = target_dimension
+        target_dimension = self._scaling_target
+        self.target_dimension = target_dimension
 
         x_scaling_factor = target_dimension["width"] / self.width
         y_scaling_factor = target_dimension["height"] / self.height
@@ -361,6 +355,21 @@ class AndroidComputerTool(BaseAnthropicTool):
         # Scale down to target resolution
         return round(x * x_scaling_factor), round(y * y_scaling_factor)
 
+    def _resolve_scaling_target(self) -> Resolution:
+        """Pick the Android resolution matching the device aspect ratio."""
+        ratio = self.width / self.height
+
+        # Find best matching Android resolution
+        for target_name, dimension in MAX_SCALING_TARGETS.items():
+            target_ratio = dimension["width"] / dimension["height"]
+            if abs(target_ratio - ratio) < 0.05:  # Allow for aspect ratio variations
+                if dimension["width"] <= self.width:
+                    return dimension
+                break
+
+        # Default to FHD if no match found
+        return MAX_SCALING_TARGETS["FHD"]
+
     def get_screen_size(self):
         """Get Android device screen size using ADB."""
         try:
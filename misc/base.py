@@ -20,7 +20,7 @@ class BaseAnthropicTool(metaclass=ABCMeta):
         raise NotImplementedError
 
 
-@dataclass(kw_only=True, frozen=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
 class ToolResult:
     """Represents the result of a tool execution."""
 